@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+# Config helpers shared by render.py and cloudflare_dns.py so both validate edge.sites the same way.
+
+import re
+from dataclasses import dataclass
+from typing import Any, Iterator
+
+# Optional "*." wildcard prefix followed by at least two dot-separated labels.
+_FQDN_RE = re.compile(r"(?:\*\.)?[a-zA-Z0-9-]+(?:\.[a-zA-Z0-9-]+)+")
+
+
+@dataclass(frozen=True)
+class Site:
+    name: str
+    type: str
+    server_names: list[str]
+    cert_name: str
+    upstream: str
+
+
+def _require_str(obj: Any, key_path: str) -> str:
+    if not isinstance(obj, str) or not obj.strip():
+        raise ValueError(f"Expected non-empty string at {key_path}")
+    return obj
+
+
+def is_valid_server_name(name: str) -> bool:
+    # allow wildcard *.example.com
+    return _FQDN_RE.fullmatch(name) is not None
+
+
+def cert_name_for_tls_domains(tls_domains: list[str]) -> str:
+    # Certbot's live dir is usually named after the first domain requested.
+    # We pick the first *non-wildcard* domain if present, else the first entry.
+    for d in tls_domains:
+        if not d.startswith("*."):
+            return d
+    return tls_domains[0]
+
+
+def _parse_sites(cfg: dict[str, Any]) -> tuple[Site, ...]:
+    edge = cfg.get("edge")
+    if not isinstance(edge, dict):
+        raise ValueError("edge must be a mapping")
+
+    sites_cfg = edge.get("sites")
+    if not isinstance(sites_cfg, list) or not sites_cfg:
+        raise ValueError("edge.sites must be a non-empty list")
+
+    sites: list[Site] = []
+    for idx, s in enumerate(sites_cfg):
+        if not isinstance(s, dict):
+            raise ValueError(f"edge.sites[{idx}] must be a mapping")
+
+        name = _require_str(s.get("name"), f"edge.sites[{idx}].name")
+        stype = _require_str(s.get("type"), f"edge.sites[{idx}].type")
+        upstream = _require_str(s.get("upstream"), f"edge.sites[{idx}].upstream")
+
+        tls_domains = s.get("tls_domains")
+        if not isinstance(tls_domains, list) or not tls_domains:
+            raise ValueError(f"edge.sites[{idx}].tls_domains must be a non-empty list")
+        tls_domains_str = [_require_str(x, f"edge.sites[{idx}].tls_domains[]") for x in tls_domains]
+
+        for d in tls_domains_str:
+            if not is_valid_server_name(d):
+                raise ValueError(f"Invalid domain in edge.sites[{idx}].tls_domains: {d}")
+
+        sites.append(
+            Site(
+                name=name,
+                type=stype,
+                server_names=tls_domains_str,
+                cert_name=cert_name_for_tls_domains(tls_domains_str),
+                upstream=upstream,
+            )
+        )
+    return tuple(sites)
+
+
+# One-slot memo: (cfg, sites). Holding the cfg reference keeps its id() from being reused.
+_LAST_SITES: tuple[dict[str, Any], tuple[Site, ...]] | None = None
+
+
+def iter_sites(cfg: dict[str, Any]) -> Iterator[Site]:
+    """Yield validated edge.sites entries; raises ValueError on invalid config.
+
+    Back-to-back calls with the same cfg object (e.g. render then DNS in one process)
+    reuse the first walk.
+    """
+    global _LAST_SITES
+    if _LAST_SITES is None or _LAST_SITES[0] is not cfg:
+        _LAST_SITES = (cfg, _parse_sites(cfg))
+    return iter(_LAST_SITES[1])
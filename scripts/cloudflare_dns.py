@@ -2,10 +2,14 @@
 from __future__ import annotations
 
 import argparse
+import concurrent.futures
+import hashlib
+import http.client
 import json
 import os
-import re
 import sys
+import threading
+import time
 import urllib.parse
 import urllib.request
 import ipaddress
@@ -13,17 +17,27 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Iterable
 
+from _config import iter_sites
+from compile_config import load_compiled, load_yaml, write_compiled
+
 try:
-    import yaml  # type: ignore
-except Exception as e:  # pragma: no cover
-    raise SystemExit(
-        "PyYAML is required. Install with: python3 -m pip install pyyaml\n"
-        "On Ubuntu: sudo apt-get install -y python3-yaml\n"
-        "On Amazon Linux 2023: sudo dnf install -y python3-pyyaml"
-    ) from e
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None  # optional: faster JSON for large zone/record listings
 
 
 CF_API_BASE = "https://api.cloudflare.com/client/v4"
+_CF_API = urllib.parse.urlsplit(CF_API_BASE)
+
+# Retry policy for transient API responses (429 is retried for any method).
+_RETRY_STATUSES = frozenset({429, 502, 503, 504})
+_IDEMPOTENT_METHODS = frozenset({"GET", "PUT", "DELETE"})
+_MAX_RETRIES = 3
+_RETRY_BACKOFF = 0.3
+
+# Zone list cache (zones rarely change); bypass with --refresh-zones.
+ZONES_CACHE_PATH = Path(os.path.expanduser("~/.cache/wp-setup/zones.json"))
+ZONES_CACHE_TTL = 3600
 
 
 def _http_get_text(url: str, timeout: int = 10) -> str:
@@ -47,18 +61,23 @@ def _detect_public_ip(version: int) -> str:
         ]
     )
 
+    # Providers are independent: query them concurrently and take the first usable answer.
     last_err: Exception | None = None
-    for url in candidates:
-        try:
-            txt = _http_get_text(url)
-            ip = ipaddress.ip_address(txt)
-            if ip.version != version:
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(candidates))
+    try:
+        futures = [executor.submit(_http_get_text, url) for url in candidates]
+        for fut in concurrent.futures.as_completed(futures, timeout=15):
+            try:
+                ip = ipaddress.ip_address(fut.result())
+            except Exception as e:  # pragma: no cover
+                last_err = e
                 continue
-            if ip.is_global:
+            if ip.version == version and ip.is_global:
                 return str(ip)
-        except Exception as e:  # pragma: no cover
-            last_err = e
-            continue
+    except concurrent.futures.TimeoutError as e:  # pragma: no cover
+        last_err = e
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
     raise RuntimeError(
         f"Failed to auto-detect public IPv{version}. "
@@ -67,29 +86,66 @@ def _detect_public_ip(version: int) -> str:
     )
 
 
-def _read_text(path: Path) -> str:
-    return path.read_text(encoding="utf-8")
+def _json_loads(raw: bytes) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode("utf-8")
 
 
 def _load_yaml(path: Path) -> dict[str, Any]:
-    data = yaml.safe_load(_read_text(path))
-    if not isinstance(data, dict):
-        raise ValueError("config root must be a mapping")
+    # The compiled CONFIG module skips importing/parsing PyYAML while config.yml is unchanged.
+    data = load_compiled(path)
+    if data is None:
+        data = load_yaml(path)
+        write_compiled(path, data)
+    return data
+
+
+def _load_yaml_cached(path: Path) -> dict[str, Any]:
+    # JSON sidecar keyed by the YAML file's mtime+size; skips YAML parsing on unchanged runs.
+    cache_path = path.with_suffix(".cache.json")
+    st = path.stat()
+    try:
+        with cache_path.open("r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if (
+            isinstance(cached, dict)
+            and cached.get("mtime_ns") == st.st_mtime_ns
+            and cached.get("size") == st.st_size
+            and isinstance(cached.get("data"), dict)
+        ):
+            return cached["data"]
+    except (OSError, ValueError):
+        pass
+
+    data = _load_yaml(path)
+    try:
+        # Only cache configs that survive a JSON round-trip unchanged (e.g. no dates/int keys).
+        if json.loads(json.dumps(data)) == data:
+            tmp = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump({"mtime_ns": st.st_mtime_ns, "size": st.st_size, "data": data}, f)
+            os.replace(tmp, cache_path)
+    except (OSError, TypeError, ValueError):
+        pass  # cache is best-effort (e.g. read-only config dir)
     return data
 
 
 def _load_env_file(path: Path) -> dict[str, str]:
     env: dict[str, str] = {}
-    for raw in _read_text(path).splitlines():
-        line = raw.strip()
-        if not line or line.startswith("#"):
-            continue
-        if line.startswith("export "):
-            line = line[len("export ") :]
-        if "=" not in line:
-            continue
-        k, v = line.split("=", 1)
-        env[k.strip()] = v.strip()
+    with path.open("r", encoding="utf-8") as f:
+        for raw in f:
+            line = raw.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("export "):
+                line = line[len("export ") :]
+            if "=" not in line:
+                continue
+            k, v = line.split("=", 1)
+            env[k.strip()] = v.strip()
     return env
 
 
@@ -111,12 +167,6 @@ def _require_str(obj: Any, key_path: str) -> str:
     return obj.strip()
 
 
-def _is_fqdn(name: str) -> bool:
-    if name.startswith("*."):
-        name = name[2:]
-    return bool(re.fullmatch(r"[a-zA-Z0-9.-]+", name)) and "." in name
-
-
 @dataclass(frozen=True)
 class DesiredRecord:
     zone_name: str
@@ -127,29 +177,93 @@ class DesiredRecord:
     proxied: bool
 
 
+# Fixed record body shape; type is always "A"/"AAAA" and strings are JSON-escaped below.
+_PAYLOAD_FMT = '{"type":"%s","name":%s,"content":%s,"ttl":%d,"proxied":%s}'
+
+
+def _record_payload(r: DesiredRecord) -> bytes:
+    return (
+        _PAYLOAD_FMT % (r.type, json.dumps(r.name), json.dumps(r.content), r.ttl, "true" if r.proxied else "false")
+    ).encode("utf-8")
+
+
 class CloudflareApi:
     def __init__(self, token: str) -> None:
         self._token = token
-
-    def _request(self, method: str, path: str, payload: dict[str, Any] | None = None) -> dict[str, Any]:
-        url = CF_API_BASE + path
+        # One keep-alive connection per thread (apply runs records on a thread pool).
+        self._local = threading.local()
+
+    def _connection(self) -> tuple[http.client.HTTPSConnection, bool]:
+        """Return (connection, reused) for the calling thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn, True
+        host = _CF_API.hostname or ""
+        proxy = urllib.request.getproxies().get("https")
+        if proxy and not urllib.request.proxy_bypass(host):
+            p = urllib.parse.urlsplit(proxy)
+            conn = http.client.HTTPSConnection(p.hostname or "", p.port or 443, timeout=30)
+            conn.set_tunnel(host, _CF_API.port or 443)
+        else:
+            conn = http.client.HTTPSConnection(host, _CF_API.port or 443, timeout=30)
+        self._local.conn = conn
+        return conn, False
+
+    def _drop_connection(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        payload: dict[str, Any] | None = None,
+        raw_body: bytes | None = None,
+    ) -> dict[str, Any]:
         headers = {
             "Authorization": f"Bearer {self._token}",
             "Content-Type": "application/json",
             "Accept": "application/json",
+            "User-Agent": "wp-setup/1.0",
         }
-        data = None
+        data = raw_body
         if payload is not None:
-            data = json.dumps(payload).encode("utf-8")
-        req = urllib.request.Request(url, data=data, headers=headers, method=method)
-        try:
-            with urllib.request.urlopen(req, timeout=30) as resp:
-                body = resp.read().decode("utf-8")
-        except urllib.error.HTTPError as e:
-            body = e.read().decode("utf-8", errors="replace")
-            raise RuntimeError(f"Cloudflare API error {e.code} for {method} {path}: {body}") from e
-        obj = json.loads(body)
+            data = _json_dumps(payload)
+
+        attempt = 0
+        while True:
+            conn, reused = self._connection()
+            try:
+                conn.request(method, _CF_API.path + path, body=data, headers=headers)
+                resp = conn.getresponse()
+                raw = resp.read()
+            except ConnectionError:
+                # The server may close an idle keep-alive connection; reconnect once and resend.
+                self._drop_connection()
+                if not reused:
+                    raise
+                continue
+            except Exception:
+                self._drop_connection()
+                raise
+            if resp.will_close:
+                self._drop_connection()
+
+            retryable = resp.status == 429 or (resp.status in _RETRY_STATUSES and method in _IDEMPOTENT_METHODS)
+            if retryable and attempt < _MAX_RETRIES:
+                time.sleep(_RETRY_BACKOFF * (2**attempt))
+                attempt += 1
+                continue
+            break
+
+        if resp.status >= 400:
+            body = raw.decode("utf-8", errors="replace")
+            raise RuntimeError(f"Cloudflare API error {resp.status} for {method} {path}: {body}")
+        obj = _json_loads(raw)
         if not isinstance(obj, dict) or not obj.get("success", False):
+            body = raw.decode("utf-8", errors="replace")
             raise RuntimeError(f"Cloudflare API failure for {method} {path}: {body}")
         return obj
 
@@ -171,6 +285,24 @@ class CloudflareApi:
             page += 1
         return zones
 
+    def list_dns_records(self, zone_id: str) -> list[dict[str, Any]]:
+        records: list[dict[str, Any]] = []
+        page = 1
+        while True:
+            q = urllib.parse.urlencode({"page": page, "per_page": 100})
+            res = self._request("GET", f"/zones/{zone_id}/dns_records?{q}")
+            batch = res.get("result")
+            if isinstance(batch, list):
+                records.extend([r for r in batch if isinstance(r, dict)])
+            info = res.get("result_info")
+            if not isinstance(info, dict):
+                break
+            total_pages = int(info.get("total_pages", page))
+            if page >= total_pages:
+                break
+            page += 1
+        return records
+
     def find_dns_record(self, zone_id: str, rtype: str, name: str) -> dict[str, Any] | None:
         q = urllib.parse.urlencode({"type": rtype, "name": name, "per_page": 50})
         res = self._request("GET", f"/zones/{zone_id}/dns_records?{q}")
@@ -181,24 +313,10 @@ class CloudflareApi:
         return None
 
     def create_dns_record(self, zone_id: str, r: DesiredRecord) -> dict[str, Any]:
-        payload = {
-            "type": r.type,
-            "name": r.name,
-            "content": r.content,
-            "ttl": r.ttl,
-            "proxied": r.proxied,
-        }
-        return self._request("POST", f"/zones/{zone_id}/dns_records", payload)
+        return self._request("POST", f"/zones/{zone_id}/dns_records", raw_body=_record_payload(r))
 
     def update_dns_record(self, zone_id: str, record_id: str, r: DesiredRecord) -> dict[str, Any]:
-        payload = {
-            "type": r.type,
-            "name": r.name,
-            "content": r.content,
-            "ttl": r.ttl,
-            "proxied": r.proxied,
-        }
-        return self._request("PUT", f"/zones/{zone_id}/dns_records/{record_id}", payload)
+        return self._request("PUT", f"/zones/{zone_id}/dns_records/{record_id}", raw_body=_record_payload(r))
 
 
 def _pick_zone_for_fqdn(fqdn: str, zone_names: Iterable[str]) -> str | None:
@@ -208,6 +326,59 @@ def _pick_zone_for_fqdn(fqdn: str, zone_names: Iterable[str]) -> str | None:
     return max(matches, key=len)
 
 
+# Labels are never empty, so "" marks "a zone ends here" inside a trie node.
+_ZONE_END = ""
+
+
+def _build_zone_trie(zone_names: Iterable[str]) -> dict[str, Any]:
+    trie: dict[str, Any] = {}
+    for zone in zone_names:
+        node = trie
+        for label in reversed(zone.split(".")):
+            node = node.setdefault(label, {})
+        node[_ZONE_END] = zone
+    return trie
+
+
+def _pick_zone_for_fqdn_trie(fqdn: str, trie: dict[str, Any]) -> str | None:
+    # Walk labels right-to-left, remembering the deepest (longest) zone seen.
+    best: str | None = None
+    node = trie
+    for label in reversed(fqdn.split(".")):
+        if not label:
+            break
+        node = node.get(label)
+        if node is None:
+            break
+        best = node.get(_ZONE_END, best)
+    return best
+
+
+def _apply_record(api: CloudflareApi, zone_id: str, r: DesiredRecord, existing: dict[str, Any] | None) -> str:
+    if existing is None:
+        api.create_dns_record(zone_id, r)
+        return "created"
+
+    existing_content = existing.get("content")
+    existing_ttl = existing.get("ttl")
+    existing_proxied = existing.get("proxied")
+
+    needs_update = (
+        str(existing_content) != r.content
+        or int(existing_ttl) != int(r.ttl)
+        or bool(existing_proxied) != bool(r.proxied)
+    )
+    if not needs_update:
+        return "unchanged"
+
+    rid = existing.get("id")
+    if not isinstance(rid, str) or not rid:
+        raise RuntimeError(f"Existing record has no id: {existing}")
+
+    api.update_dns_record(zone_id, rid, r)
+    return "updated"
+
+
 def build_desired_records(cfg: dict[str, Any]) -> list[DesiredRecord]:
     cf = cfg.get("cloudflare")
     if not isinstance(cf, dict):
@@ -224,6 +395,11 @@ def build_desired_records(cfg: dict[str, Any]) -> list[DesiredRecord]:
     if not enabled:
         return []
 
+    fqdn_set = {d for site in iter_sites(cfg) for d in site.server_names}
+    if not fqdn_set:
+        # Nothing to publish: don't hit the network for origin IP auto-detection.
+        return []
+
     origin_ipv4_cfg = dns_cfg.get("origin_ipv4")
     origin_ipv6_cfg = dns_cfg.get("origin_ipv6")
 
@@ -243,84 +419,27 @@ def build_desired_records(cfg: dict[str, Any]) -> list[DesiredRecord]:
     ttl = int(dns_cfg.get("ttl") or 1)
     proxy_enabled = _as_bool(cf.get("proxy_enabled"), default=True)
 
-    edge = cfg.get("edge")
-    if not isinstance(edge, dict):
-        raise ValueError("edge must be a mapping")
-    sites = edge.get("sites")
-    if not isinstance(sites, list) or not sites:
-        raise ValueError("edge.sites must be a non-empty list")
-
-    fqdn_set: set[str] = set()
-    for s in sites:
-        if not isinstance(s, dict):
-            continue
-        tls = s.get("tls_domains")
-        if not isinstance(tls, list):
-            continue
-        for d in tls:
-            ds = str(d).strip()
-            if ds and _is_fqdn(ds):
-                fqdn_set.add(ds)
-
-    # Determine zones by suffix match
-    # We only decide zone_name later (needs API zones list), so keep a placeholder for now.
-    # We'll fill zone_name during apply/plan.
-    desired: list[DesiredRecord] = []
+    # Zone names are filled in later (needs the API zones list), so leave a placeholder here.
+    # Keyed by (type, name); fqdn_set is already unique so each record is built once.
+    record_types = [("A", origin_ipv4)] + ([("AAAA", origin_ipv6)] if origin_ipv6 else [])
+    desired: dict[tuple[str, str], DesiredRecord] = {}
     for fqdn in sorted(fqdn_set):
-        desired.append(
-            DesiredRecord(
+        for rtype, content in record_types:
+            desired[(rtype, fqdn)] = DesiredRecord(
                 zone_name="",
-                type="A",
+                type=rtype,
                 name=fqdn,
-                content=origin_ipv4,
+                content=content,
                 ttl=ttl,
                 proxied=proxy_enabled,
             )
-        )
-        if origin_ipv6:
-            desired.append(
-                DesiredRecord(
-                    zone_name="",
-                    type="AAAA",
-                    name=fqdn,
-                    content=origin_ipv6,
-                    ttl=ttl,
-                    proxied=proxy_enabled,
-                )
-            )
 
-    return desired
+    return list(desired.values())
 
 
-def main() -> int:
-    ap = argparse.ArgumentParser(description="Upsert required Cloudflare DNS records for this stack")
-    ap.add_argument("--config", default="config/config.yml", help="Path to config.yml")
-    ap.add_argument("--secrets", default="config/secrets.env", help="Path to secrets.env")
-    ap.add_argument("--apply", action="store_true", help="Actually apply changes (default: plan only)")
-    args = ap.parse_args()
-
-    cfg = _load_yaml(Path(args.config))
-    desired = build_desired_records(cfg)
-    if not desired:
-        print("cloudflare.dns.enabled is false; nothing to do.")
-        return 0
-
-    secrets_path = Path(args.secrets)
-    secrets = _load_env_file(secrets_path) if secrets_path.exists() else {}
-
-    cf = cfg.get("cloudflare")
-    if not isinstance(cf, dict):
-        raise SystemExit("cloudflare must be a mapping")
-
-    token_env_name = str(cf.get("dns_api_token_env") or "CF_DNS_API_TOKEN").strip() or "CF_DNS_API_TOKEN"
-    token = os.environ.get(token_env_name) or secrets.get(token_env_name) or secrets.get("CF_DNS_API_TOKEN")
-    if not token:
-        raise SystemExit(
-            f"Missing Cloudflare API token. Put {token_env_name}=... into {args.secrets} (or export it)."
-        )
-
-    api = CloudflareApi(token)
-    zones = api.list_zones()
+def _resolve_records(
+    api: CloudflareApi, desired: list[DesiredRecord], zones: list[dict[str, Any]]
+) -> tuple[dict[str, str], list[DesiredRecord], dict[tuple[str, str], dict[str, Any]]]:
     zone_name_to_id: dict[str, str] = {}
     zone_names: list[str] = []
     for z in zones:
@@ -330,13 +449,16 @@ def main() -> int:
             zone_names.append(name)
             zone_name_to_id[name] = zid
 
-    # Fill zone_name for each desired record
-    filled: list[DesiredRecord] = []
+    # Fill zone_name for each desired record (a trie only pays off with many zones).
+    # build_desired_records already yields one record per (type, name), so no de-dupe is needed.
+    trie = _build_zone_trie(zone_names) if len(zone_names) >= 8 else None
+    records: list[DesiredRecord] = []
     for r in desired:
-        zone = _pick_zone_for_fqdn(r.name.lstrip("*."), zone_names)
+        fqdn = r.name.lstrip("*.")
+        zone = _pick_zone_for_fqdn_trie(fqdn, trie) if trie is not None else _pick_zone_for_fqdn(fqdn, zone_names)
         if not zone:
-            raise SystemExit(f"No Cloudflare zone found for record name: {r.name}")
-        filled.append(
+            raise LookupError(f"No Cloudflare zone found for record name: {r.name}")
+        records.append(
             DesiredRecord(
                 zone_name=zone,
                 type=r.type,
@@ -347,59 +469,124 @@ def main() -> int:
             )
         )
 
-    # De-dupe
-    uniq: dict[tuple[str, str, str], DesiredRecord] = {}
-    for r in filled:
-        uniq[(r.zone_name, r.type, r.name)] = r
-    records = list(uniq.values())
+    # Fetch each zone's records once and index them locally instead of one lookup per record.
+    index: dict[tuple[str, str], dict[str, Any]] = {}
+    for zone_name in sorted({r.zone_name for r in records}):
+        for rec in api.list_dns_records(zone_name_to_id[zone_name]):
+            rtype = rec.get("type")
+            rname = rec.get("name")
+            if isinstance(rtype, str) and isinstance(rname, str):
+                index.setdefault((rtype, rname.lower()), rec)
 
-    changed = 0
-    created = 0
-    unchanged = 0
+    return zone_name_to_id, records, index
 
-    for r in sorted(records, key=lambda x: (x.zone_name, x.type, x.name)):
-        zid = zone_name_to_id[r.zone_name]
-        existing = api.find_dns_record(zid, r.type, r.name)
 
-        if not args.apply:
-            action = "create" if existing is None else "update"
-            print(f"PLAN {action}: zone={r.zone_name} {r.type} {r.name} -> {r.content} proxied={int(r.proxied)} ttl={r.ttl}")
-            continue
-
-        if existing is None:
-            api.create_dns_record(zid, r)
-            created += 1
-            changed += 1
-            print(f"CREATED: zone={r.zone_name} {r.type} {r.name}")
-            continue
-
-        existing_content = existing.get("content")
-        existing_ttl = existing.get("ttl")
-        existing_proxied = existing.get("proxied")
-
-        needs_update = (
-            str(existing_content) != r.content
-            or int(existing_ttl) != int(r.ttl)
-            or bool(existing_proxied) != bool(r.proxied)
-        )
-        if not needs_update:
-            unchanged += 1
-            print(f"OK: zone={r.zone_name} {r.type} {r.name} (no change)")
-            continue
+def _load_zones(api: CloudflareApi, token: str, refresh: bool = False) -> tuple[list[dict[str, Any]], bool]:
+    """Return (zones, from_cache), using the on-disk zone cache when it is fresh."""
+    token_id = hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+    if not refresh:
+        try:
+            with ZONES_CACHE_PATH.open("r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if (
+                isinstance(cached, dict)
+                and cached.get("token") == token_id
+                and time.time() - float(cached.get("fetched_at", 0)) < ZONES_CACHE_TTL
+                and isinstance(cached.get("zones"), list)
+            ):
+                return cached["zones"], True
+        except (OSError, ValueError, TypeError):
+            pass
+
+    # Keep only the fields we use.
+    zones = [{"name": z.get("name"), "id": z.get("id")} for z in api.list_zones()]
+    try:
+        ZONES_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp = ZONES_CACHE_PATH.with_name(f"{ZONES_CACHE_PATH.name}.{os.getpid()}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump({"token": token_id, "fetched_at": time.time(), "zones": zones}, f)
+        os.replace(tmp, ZONES_CACHE_PATH)
+    except OSError:
+        pass  # cache is best-effort
+    return zones, False
+
 
-        rid = existing.get("id")
-        if not isinstance(rid, str) or not rid:
-            raise RuntimeError(f"Existing record has no id: {existing}")
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Upsert required Cloudflare DNS records for this stack")
+    ap.add_argument("--config", default="config/config.yml", help="Path to config.yml")
+    ap.add_argument("--secrets", default="config/secrets.env", help="Path to secrets.env")
+    ap.add_argument("--apply", action="store_true", help="Actually apply changes (default: plan only)")
+    ap.add_argument("--refresh-zones", action="store_true", help="Ignore the cached Cloudflare zone list")
+    ap.add_argument("--serial", action="store_true", help="Apply records one at a time (for debugging)")
+    args = ap.parse_args()
+
+    cfg = _load_yaml_cached(Path(args.config))
+    desired = build_desired_records(cfg)
+    if not desired:
+        print("cloudflare.dns.enabled is false or no tls_domains are configured; nothing to do.")
+        return 0
 
-        api.update_dns_record(zid, rid, r)
-        changed += 1
-        print(f"UPDATED: zone={r.zone_name} {r.type} {r.name}")
+    cf = cfg.get("cloudflare")
+    if not isinstance(cf, dict):
+        raise SystemExit("cloudflare must be a mapping")
 
-    if args.apply:
-        print(f"Done. created={created} updated={changed - created} unchanged={unchanged}")
-    else:
+    token_env_name = str(cf.get("dns_api_token_env") or "CF_DNS_API_TOKEN").strip() or "CF_DNS_API_TOKEN"
+    token = os.environ.get(token_env_name)
+    if not token:
+        # Only read secrets.env when the token isn't already exported (cloudflare-dns.sh/CI export it).
+        secrets_path = Path(args.secrets)
+        secrets = _load_env_file(secrets_path) if secrets_path.exists() else {}
+        token = secrets.get(token_env_name) or secrets.get("CF_DNS_API_TOKEN")
+    if not token:
+        raise SystemExit(
+            f"Missing Cloudflare API token. Put {token_env_name}=... into {args.secrets} (or export it)."
+        )
+
+    api = CloudflareApi(token)
+    zones, from_cache = _load_zones(api, token, refresh=args.refresh_zones)
+    try:
+        try:
+            zone_name_to_id, records, index = _resolve_records(api, desired, zones)
+        except (LookupError, RuntimeError):
+            # A stale cached zone list can miss new zones or hold deleted zone ids; retry once fresh.
+            if not from_cache:
+                raise
+            zones, _ = _load_zones(api, token, refresh=True)
+            zone_name_to_id, records, index = _resolve_records(api, desired, zones)
+    except LookupError as e:
+        raise SystemExit(str(e)) from e
+
+    ordered = sorted(records, key=lambda x: (x.zone_name, x.type, x.name))
+    existing_by_record = [index.get((r.type, r.name.lower())) for r in ordered]
+
+    if not args.apply:
+        for r, existing in zip(ordered, existing_by_record):
+            action = "create" if existing is None else "update"
+            print(f"PLAN {action}: zone={r.zone_name} {r.type} {r.name} -> {r.content} proxied={int(r.proxied)} ttl={r.ttl}")
         print(f"Done. planned_records={len(records)}")
+        return 0
+
+    def apply_one(item: tuple[DesiredRecord, dict[str, Any] | None]) -> str:
+        r, existing = item
+        return _apply_record(api, zone_name_to_id[r.zone_name], r, existing)
 
+    # Records are independent, so issue the create/update calls concurrently unless asked not to.
+    items = list(zip(ordered, existing_by_record))
+    if args.serial or len(items) <= 1:
+        actions = [apply_one(item) for item in items]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(16, len(items))) as executor:
+            actions = list(executor.map(apply_one, items))
+
+    labels = {"created": "CREATED", "updated": "UPDATED", "unchanged": "OK"}
+    for r, action in zip(ordered, actions):
+        suffix = " (no change)" if action == "unchanged" else ""
+        print(f"{labels[action]}: zone={r.zone_name} {r.type} {r.name}{suffix}")
+
+    created = actions.count("created")
+    updated = actions.count("updated")
+    unchanged = actions.count("unchanged")
+    print(f"Done. created={created} updated={updated} unchanged={unchanged}")
     return 0
 
 
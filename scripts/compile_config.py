@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+# Compile config.yml into a sibling Python module (config.compiled.py) holding a CONFIG literal.
+# render.py / cloudflare_dns.py load the compiled module while it is newer than the YAML file,
+# so unchanged runs never import or parse PyYAML. They regenerate it automatically on change;
+# this script can also be run by hand (e.g. right after editing config.yml).
+
+import argparse
+import ast
+import importlib.util
+import os
+import pprint
+from pathlib import Path
+from typing import Any
+
+
+def compiled_path(config_path: Path) -> Path:
+    return config_path.with_suffix(".compiled.py")
+
+
+def load_yaml(config_path: Path) -> dict[str, Any]:
+    try:
+        import yaml  # type: ignore
+    except Exception as e:  # pragma: no cover
+        raise SystemExit(
+            "PyYAML is required. Install with: python3 -m pip install pyyaml\n"
+            "On Ubuntu: sudo apt-get install -y python3-yaml\n"
+            "On Amazon Linux 2023: sudo dnf install -y python3-pyyaml"
+        ) from e
+
+    # Prefer the libyaml-backed loader when PyYAML was built with it.
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    data = yaml.load(config_path.read_text(encoding="utf-8"), Loader=loader)
+    if not isinstance(data, dict):
+        raise ValueError("config root must be a mapping")
+    return data
+
+
+def load_compiled(config_path: Path) -> dict[str, Any] | None:
+    """Return CONFIG from the compiled module if it is at least as new as config_path."""
+    path = compiled_path(config_path)
+    try:
+        if path.stat().st_mtime_ns < config_path.stat().st_mtime_ns:
+            return None
+        spec = importlib.util.spec_from_file_location("wp_setup_config_compiled", path)
+        if spec is None or spec.loader is None:
+            return None
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+    except (OSError, SyntaxError):
+        return None
+    data = getattr(mod, "CONFIG", None)
+    return data if isinstance(data, dict) else None
+
+
+def write_compiled(config_path: Path, data: dict[str, Any]) -> Path | None:
+    """Write the compiled module atomically; returns None if data has no exact literal form."""
+    path = compiled_path(config_path)
+    literal = pprint.pformat(data, width=120, sort_dicts=False)
+    try:
+        # e.g. YAML timestamps become datetime objects, which are not plain literals.
+        if ast.literal_eval(literal) != data:
+            return None
+    except (ValueError, SyntaxError):
+        return None
+
+    text = f"# Generated from {config_path.name} by scripts/compile_config.py. Do not edit.\nCONFIG = {literal}\n"
+    try:
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError:
+        return None  # best-effort (e.g. read-only config dir)
+    return path
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compile config.yml into config.compiled.py")
+    parser.add_argument("--config", default="config/config.yml", help="Path to config.yml")
+    args = parser.parse_args()
+
+    config_path = Path(args.config)
+    out = write_compiled(config_path, load_yaml(config_path))
+    if out is None:
+        raise SystemExit(f"Could not compile {config_path} (non-literal values or unwritable directory)")
+    print(f"Compiled to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,43 +2,115 @@
 from __future__ import annotations
 
 import argparse
+import json
 import os
 import re
 import shutil
-from dataclasses import dataclass
+import stat
+from functools import lru_cache
 from pathlib import Path
 from typing import Any
 
-try:
-    import yaml  # type: ignore
-except Exception as e:  # pragma: no cover
-    raise SystemExit(
-        "PyYAML is required. Install with: python3 -m pip install pyyaml\n"
-        "On Ubuntu: sudo apt-get install -y python3-yaml\n"
-        "On Amazon Linux 2023: sudo dnf install -y python3-pyyaml"
-    ) from e
+from _config import Site, iter_sites
+from compile_config import load_compiled, load_yaml, write_compiled
 
 
-def _read_text(path: Path) -> str:
+_PLACEHOLDER_RE = re.compile(r"\{\{(\w+)\}\}")
+
+# Parent directories already created during the current render() (reset per render).
+_MKDIR_CACHE: set[Path] = set()
+
+
+@lru_cache(maxsize=64)
+def _read_text_cached(path: Path, mtime_ns: int, size: int) -> str:
     return path.read_text(encoding="utf-8")
 
 
-def _write_text(path: Path, content: str) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(content, encoding="utf-8")
+def _read_text(path: Path) -> str:
+    # Keyed on mtime+size so edited templates/secrets are picked up on the next render.
+    st = path.stat()
+    return _read_text_cached(path, st.st_mtime_ns, st.st_size)
 
 
-def _copy_tree(src: Path, dst: Path) -> None:
-    if dst.exists():
-        shutil.rmtree(dst)
-    shutil.copytree(src, dst)
+def _write_text(path: Path, content: str) -> None:
+    # Leave identical files untouched so mtimes don't churn (compose/nginx watchers).
+    data = content.encode("utf-8")
+    mode: int | None = None
+    try:
+        st = path.stat()
+        if st.st_size == len(data) and path.read_bytes() == data:
+            return
+        mode = stat.S_IMODE(st.st_mode)  # keep e.g. chmod 600 on secrets.env
+    except FileNotFoundError:
+        pass
+    if path.parent not in _MKDIR_CACHE:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _MKDIR_CACHE.add(path.parent)
+    # Write to a temp file and rename so a crash never leaves a truncated output.
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    if mode is not None:
+        os.chmod(tmp, mode)
+    os.replace(tmp, path)
+
+
+def _copy_file(src: Path, dst: Path) -> None:
+    # copy2 preserves mtime, so an unchanged source matches on the next run and is skipped.
+    s = src.stat()
+    try:
+        d = dst.stat()
+        if d.st_size == s.st_size and d.st_mtime_ns == s.st_mtime_ns:
+            return
+    except FileNotFoundError:
+        dst.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(src, dst)
+
+
+def _sync_tree(src: Path, dst: Path) -> set[Path]:
+    """Copy src into dst, touching only files whose size/mtime differ.
+
+    Returns the set of destination files that belong to the tree.
+    """
+    synced: set[Path] = set()
+    with os.scandir(src) as it:
+        for entry in it:
+            target = dst / entry.name
+            if entry.is_dir(follow_symlinks=False):
+                synced |= _sync_tree(Path(entry.path), target)
+            else:
+                _copy_file(Path(entry.path), target)
+                synced.add(target)
+    return synced
+
+
+def _prune_tree(root: Path, keep: set[Path]) -> None:
+    # Remove files (and then-empty directories) under root that were not produced by this render.
+    with os.scandir(root) as it:
+        entries = list(it)
+    for entry in entries:
+        path = root / entry.name
+        if entry.is_dir(follow_symlinks=False):
+            _prune_tree(path, keep)
+            if not any(path.iterdir()):
+                path.rmdir()
+        elif path not in keep:
+            path.unlink()
+
+
+@lru_cache(maxsize=64)
+def _compile_template(template: str) -> tuple[str | tuple[str], ...]:
+    # Alternating literal chunks and (key,) placeholders, parsed once per template text.
+    parts = _PLACEHOLDER_RE.split(template)
+    return tuple(p if i % 2 == 0 else (p,) for i, p in enumerate(parts) if p)
+
+
+def _render_compiled(parts: tuple[str | tuple[str], ...], mapping: dict[str, str]) -> str:
+    # Unknown placeholders are left intact.
+    return "".join(p if isinstance(p, str) else mapping.get(p[0], "{{" + p[0] + "}}") for p in parts)
 
 
 def _render_template(template: str, mapping: dict[str, str]) -> str:
-    out = template
-    for key, value in mapping.items():
-        out = out.replace("{{" + key + "}}", value)
-    return out
+    return _render_compiled(_compile_template(template), mapping)
 
 
 def _require_str(obj: Any, key_path: str) -> str:
@@ -54,35 +126,42 @@ def _require_int(obj: Any, key_path: str) -> int:
 
 
 def _load_yaml(path: Path) -> dict[str, Any]:
-    data = yaml.safe_load(_read_text(path))
-    if not isinstance(data, dict):
-        raise ValueError("config root must be a mapping")
+    # The compiled CONFIG module skips importing/parsing PyYAML while config.yml is unchanged.
+    data = load_compiled(path)
+    if data is None:
+        data = load_yaml(path)
+        write_compiled(path, data)
     return data
 
 
-@dataclass(frozen=True)
-class Site:
-    name: str
-    type: str
-    server_names: list[str]
-    cert_name: str
-    upstream: str
-
-
-def _is_valid_server_name(name: str) -> bool:
-    # allow wildcard *.example.com
-    if name.startswith("*."):
-        name = name[2:]
-    return bool(re.fullmatch(r"[a-zA-Z0-9.-]+", name)) and "." in name
-
-
-def _cert_name_for_tls_domains(tls_domains: list[str]) -> str:
-    # Certbot's live dir is usually named after the first domain requested.
-    # We pick the first *non-wildcard* domain if present, else the first entry.
-    for d in tls_domains:
-        if not d.startswith("*."):
-            return d
-    return tls_domains[0]
+def _load_yaml_cached(path: Path) -> dict[str, Any]:
+    # JSON sidecar keyed by the YAML file's mtime+size; skips YAML parsing on unchanged runs.
+    cache_path = path.with_suffix(".cache.json")
+    st = path.stat()
+    try:
+        with cache_path.open("r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if (
+            isinstance(cached, dict)
+            and cached.get("mtime_ns") == st.st_mtime_ns
+            and cached.get("size") == st.st_size
+            and isinstance(cached.get("data"), dict)
+        ):
+            return cached["data"]
+    except (OSError, ValueError):
+        pass
+
+    data = _load_yaml(path)
+    try:
+        # Only cache configs that survive a JSON round-trip unchanged (e.g. no dates/int keys).
+        if json.loads(json.dumps(data)) == data:
+            tmp = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump({"mtime_ns": st.st_mtime_ns, "size": st.st_size, "data": data}, f)
+            os.replace(tmp, cache_path)
+    except (OSError, TypeError, ValueError):
+        pass  # cache is best-effort (e.g. read-only config dir)
+    return data
 
 
 def parse_sites(config: dict[str, Any]) -> tuple[int, str, list[Site], int, int, int, int, int]:
@@ -125,45 +204,15 @@ def parse_sites(config: dict[str, Any]) -> tuple[int, str, list[Site], int, int,
         "wordpress.php.max_input_time",
     )
 
-    sites_cfg = edge.get("sites")
-    if not isinstance(sites_cfg, list) or not sites_cfg:
-        raise ValueError("edge.sites must be a non-empty list")
-
-    sites: list[Site] = []
-    for idx, s in enumerate(sites_cfg):
-        if not isinstance(s, dict):
-            raise ValueError(f"edge.sites[{idx}] must be a mapping")
-
-        name = _require_str(s.get("name"), f"edge.sites[{idx}].name")
-        stype = _require_str(s.get("type"), f"edge.sites[{idx}].type")
-        upstream = _require_str(s.get("upstream"), f"edge.sites[{idx}].upstream")
-
-        tls_domains = s.get("tls_domains")
-        if not isinstance(tls_domains, list) or not tls_domains:
-            raise ValueError(f"edge.sites[{idx}].tls_domains must be a non-empty list")
-        tls_domains_str = [_require_str(x, f"edge.sites[{idx}].tls_domains[]") for x in tls_domains]
-
-        for d in tls_domains_str:
-            if not _is_valid_server_name(d):
-                raise ValueError(f"Invalid domain in edge.sites[{idx}].tls_domains: {d}")
-
-        cert_name = _cert_name_for_tls_domains(tls_domains_str)
-        sites.append(
-            Site(
-                name=name,
-                type=stype,
-                server_names=tls_domains_str,
-                cert_name=cert_name,
-                upstream=upstream,
-            )
-        )
+    sites = list(iter_sites(config))
 
     # NOTE: Keep return type stable for render() below.
     return bind_port, le_dir, sites, upload_max_mb, post_max_mb, memory_limit_mb, max_execution_time, max_input_time
 
 
 def render(config_path: Path, templates_dir: Path, out_dir: Path) -> None:
-    config = _load_yaml(config_path)
+    _MKDIR_CACHE.clear()
+    config = _load_yaml_cached(config_path)
     (
         bind_port,
         le_dir,
@@ -180,17 +229,20 @@ def render(config_path: Path, templates_dir: Path, out_dir: Path) -> None:
     if (out_dir / "secrets.env").exists():
         preserved_secrets = _read_text(out_dir / "secrets.env")
 
-    # Recreate out dir
-    if out_dir.exists():
-        shutil.rmtree(out_dir)
+    # Update out dir in place; anything not produced below is pruned at the end.
     out_dir.mkdir(parents=True, exist_ok=True)
+    written: set[Path] = set()
+
+    def emit(path: Path, content: str) -> None:
+        _write_text(path, content)
+        written.add(path)
 
     # Copy snippets template tree
-    _copy_tree(templates_dir / "nginx" / "snippets", out_dir / "nginx" / "snippets")
+    written |= _sync_tree(templates_dir / "nginx" / "snippets", out_dir / "nginx" / "snippets")
 
     # Render internal WordPress nginx site configs (wp-a/wp-b)
     wp_site_tpl = _read_text(templates_dir / "nginx" / "wp" / "site.conf.template")
-    _write_text(
+    emit(
         out_dir / "nginx" / "wp-a" / "site.conf",
         _render_template(
             wp_site_tpl,
@@ -200,7 +252,7 @@ def render(config_path: Path, templates_dir: Path, out_dir: Path) -> None:
             },
         ),
     )
-    _write_text(
+    emit(
         out_dir / "nginx" / "wp-b" / "site.conf",
         _render_template(
             wp_site_tpl,
@@ -215,11 +267,12 @@ def render(config_path: Path, templates_dir: Path, out_dir: Path) -> None:
     edge_base = _read_text(templates_dir / "nginx" / "edge" / "edge.conf.template")
     server_tpl = _read_text(templates_dir / "nginx" / "edge" / "server-block.template")
 
+    server_parts = _compile_template(server_tpl)
     server_blocks: list[str] = []
     for s in sites:
         server_blocks.append(
-            _render_template(
-                server_tpl,
+            _render_compiled(
+                server_parts,
                 {
                     "SERVER_NAME": " ".join(s.server_names),
                     "CERT_NAME": s.cert_name,
@@ -235,7 +288,7 @@ def render(config_path: Path, templates_dir: Path, out_dir: Path) -> None:
             "UPLOAD_MAX_MB": str(upload_max_mb),
         },
     )
-    _write_text(out_dir / "nginx" / "edge" / "00-edge.conf", edge_conf)
+    emit(out_dir / "nginx" / "edge" / "00-edge.conf", edge_conf)
 
     # Render php.ini
     php_ini_tpl = _read_text(templates_dir / "php-fpm" / "php.ini.template")
@@ -249,10 +302,11 @@ def render(config_path: Path, templates_dir: Path, out_dir: Path) -> None:
             "MAX_INPUT_TIME": str(max_input_time),
         },
     )
-    _write_text(out_dir / "php-fpm" / "php.ini", php_ini)
+    emit(out_dir / "php-fpm" / "php.ini", php_ini)
 
     # Copy php-fpm Dockerfile
-    shutil.copy2(templates_dir / "php-fpm" / "Dockerfile", out_dir / "php-fpm" / "Dockerfile")
+    _copy_file(templates_dir / "php-fpm" / "Dockerfile", out_dir / "php-fpm" / "Dockerfile")
+    written.add(out_dir / "php-fpm" / "Dockerfile")
 
     # Copy php-fpm Dockerfile + entrypoint templates if present later
     # (kept simple for now)
@@ -266,31 +320,33 @@ def render(config_path: Path, templates_dir: Path, out_dir: Path) -> None:
             "LE_DIR": le_dir,
         },
     )
-    _write_text(out_dir / "docker-compose.yml", compose)
+    emit(out_dir / "docker-compose.yml", compose)
 
     # Convenience: copy secrets.env.example for operator
     secrets_example = config_path.parent / "secrets.env.example"
     if secrets_example.exists():
-        _write_text(out_dir / "secrets.env.example", _read_text(secrets_example))
+        emit(out_dir / "secrets.env.example", _read_text(secrets_example))
 
     # Copy canonical secrets if present
     canonical_secrets = config_path.parent / "secrets.env"
     secrets_content: str | None = None
     if canonical_secrets.exists():
         secrets_content = _read_text(canonical_secrets)
-        _write_text(out_dir / "secrets.env", secrets_content)
+        emit(out_dir / "secrets.env", secrets_content)
     elif preserved_secrets is not None:
         secrets_content = preserved_secrets
-        _write_text(out_dir / "secrets.env", secrets_content)
+        emit(out_dir / "secrets.env", secrets_content)
 
     # Also write .env for docker compose variable substitution.
     # Note: env_file sets container env, but ${VAR} substitution is resolved from
     # the compose CLI environment / .env / --env-file.
     if secrets_content is not None:
-        _write_text(out_dir / ".env", secrets_content)
+        emit(out_dir / ".env", secrets_content)
 
     # Copy certbot helper script templates are host-side; nothing to do here.
 
+    _prune_tree(out_dir, written)
+
 
 def main() -> int:
     parser = argparse.ArgumentParser(description="Render docker-compose/nginx from config.yml")